@@ -34,13 +34,24 @@
 
 
 import os
+import abc
 import shutil
 import re
 import glob
+import posixpath
 import sys
 import json
 import datetime
-from pathlib import Path
+import array
+import bisect
+import collections
+import contextlib
+import functools
+import hashlib
+import heapq
+import io
+import stat
+import time
 
 
 def fread(filename):
@@ -50,13 +61,194 @@ def fread(filename):
 
 
 def fwrite(filename, text):
-    """Write content to file and close the file."""
-    basedir = os.path.dirname(filename)
-    if not os.path.isdir(basedir):
-        os.makedirs(basedir)
+    """Write content to file through the current output sink."""
+    _sink.write(filename, text.encode())
 
-    with open(filename, 'w') as f:
-        f.write(text)
+
+@contextlib.contextmanager
+def fopen(filename):
+    """Open a buffered text Writer on filename through the output sink."""
+    with _sink.open(filename) as f:
+        out = Writer(f)
+        yield out
+        out.flush()
+    _sink.record(filename, out.digest.hexdigest())
+
+
+class HashWriter:
+    """Binary file wrapper that hashes the data written through it."""
+
+    def __init__(self, f):
+        self.f = f
+        self.digest = hashlib.sha1()
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.f.write(data)
+
+
+class Writer:
+    """Buffer encoded text for a binary file and hash it on the way."""
+
+    def __init__(self, f, bufsize=64 * 1024):
+        self.f = f
+        self.bufsize = bufsize
+        self.digest = hashlib.sha1()
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        data = text.encode()
+        self.digest.update(data)
+        self.parts.append(data)
+        self.size += len(data)
+        if self.size >= self.bufsize:
+            self.flush()
+
+    def flush(self):
+        self.f.write(b''.join(self.parts))
+        self.parts = []
+        self.size = 0
+
+
+def relname(filename, root='_site'):
+    """Return filename relative to root with '/' separators, else None."""
+    rel = os.path.relpath(filename, root)
+    if rel.startswith(os.pardir):
+        return None
+    return rel.replace(os.sep, '/')
+
+
+def copy_static(src, dst):
+    """Copy static files into dst through the current output sink."""
+    for dirpath, _, filenames in os.walk(src):
+        for name in filenames:
+            filename = os.path.join(dst, os.path.relpath(dirpath, src), name)
+            _sink.copy(os.path.join(dirpath, name), os.path.normpath(filename))
+
+
+class Sink(abc.ABC):
+    """Destination of generated files below root; subclasses implement open().
+
+    The manifest maps paths relative to root to content hashes of the
+    files written so far; previous is the manifest of the last build.
+    """
+
+    def __init__(self, root='_site'):
+        self.root = root
+        self.manifest = {}
+        self.previous = {}
+
+    def record(self, filename, digest):
+        """Record the content hash of a file written below root."""
+        rel = relname(filename, self.root)
+        if rel and rel not in (manifest_name, archive_name):
+            self.manifest[rel] = digest
+
+    def keep(self, filename):
+        """Keep filename from the last build instead of writing it again.
+
+        Return False if the sink cannot keep it, so that the caller has
+        to generate the file.
+        """
+        return False
+
+    @abc.abstractmethod
+    def open(self, filename):
+        """Return a context manager yielding a binary file for filename."""
+
+    def write(self, filename, data):
+        """Write data to filename and record its hash."""
+        with self.open(filename) as f:
+            f.write(data)
+        self.record(filename, hashlib.sha1(data).hexdigest())
+
+    def copy(self, src, filename):
+        """Stream the file src to filename and record its hash."""
+        with open(src, 'rb') as fsrc, self.open(filename) as f:
+            out = HashWriter(f)
+            shutil.copyfileobj(fsrc, out)
+        self.record(filename, out.digest.hexdigest())
+
+    def close(self):
+        pass
+
+
+class DirSink(Sink):
+    """Write output files to the filesystem."""
+
+    def keep(self, filename):
+        rel = relname(filename, self.root)
+        if rel not in self.previous or not os.path.isfile(filename):
+            return False
+        self.manifest[rel] = self.previous[rel]
+        return True
+
+    def open(self, filename):
+        basedir = os.path.dirname(filename)
+        if basedir and not os.path.isdir(basedir):
+            os.makedirs(basedir)
+        return open(filename, 'wb')
+
+    def copy(self, src, filename):
+        super().copy(src, filename)
+        shutil.copystat(src, filename)
+
+
+class MemorySink(Sink):
+    """Keep output files in a dict keyed by path relative to root."""
+
+    def __init__(self, root='_site'):
+        super().__init__(root)
+        self.files = {}
+
+    @contextlib.contextmanager
+    def open(self, filename):
+        f = io.BytesIO()
+        yield f
+        self.files[relname(filename, self.root) or filename] = f.getvalue()
+
+
+class ArchiveSink(Sink):
+    """Stream output files into a tar or zip archive in a single pass."""
+
+    def __init__(self, fileobj, fmt='tar', compression='', root='_site',
+                 closefd=False):
+        super().__init__(root)
+        self.fileobj = fileobj if closefd else None
+        self.fmt = fmt
+        if fmt == 'zip':
+            import zipfile
+            self.archive = zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED)
+        else:
+            import tarfile
+            self.archive = tarfile.open(fileobj=fileobj,
+                                        mode='w|' + compression)
+
+    @contextlib.contextmanager
+    def open(self, filename):
+        name = relname(filename, self.root) or filename.lstrip('/')
+        if self.fmt == 'zip':
+            with self.archive.open(name, 'w', force_zip64=True) as f:
+                yield f
+            return
+
+        # Tar headers need the size up front, so spool large files to disk.
+        import tarfile
+        import tempfile
+        with tempfile.SpooledTemporaryFile(1024 * 1024) as f:
+            yield f
+            info = tarfile.TarInfo(name)
+            info.size = f.tell()
+            info.mtime = int(time.time())
+            info.mode = 0o644
+            f.seek(0)
+            self.archive.addfile(info, f)
+
+    def close(self):
+        self.archive.close()
+        if self.fileobj:
+            self.fileobj.close()
 
 
 def err(msg, *args):
@@ -88,27 +280,119 @@ def rfc_2822_format(date_str):
     return d.strftime('%a, %d %b %Y %H:%M:%S +0000')
 
 
-def read_content(filename):
-    """Read content and metadata from file into a dictionary."""
+def scan_headers(filename, chunksize=4096):
+    """Read only the leading header block of a file in chunks.
+
+    Return (headers, end) where end is the offset of the body text.
+    Each chunk is parsed from the start of the last complete header on.
+    """
+    headers = {}
+    offset = 0      # characters dropped from the front of text
+    text = ''
+    with open(filename, 'r') as f:
+        while True:
+            chunk = f.read(chunksize)
+            text += chunk
+            start = end = 0
+            for key, val, pos in read_headers(text):
+                headers[key] = val
+                start, end = end, pos
+            # Stop at the first non-header text, unless it may be the
+            # start of a header comment cut off at the end of the chunk.
+            rest = text[end:].lstrip()
+            partial = rest[:4] == '<!--'[:len(rest[:4])] and '-->' not in rest
+            if not chunk or not partial:
+                return headers, offset + end
+            # Keep the last header, as its trailing blanks may go on.
+            offset += start
+            text = text[start:]
+
+
+def markdown(text, filename):
+    """Convert Markdown text read from filename to HTML if possible.
+
+    HTML rendered ahead of time by prerender_markdown() is taken from
+    _markdown, keyed by a hash of the text.
+    """
+    try:
+        if _test == 'ImportError':
+            raise ImportError('Error forced by test')
+        if _markdown:
+            html = _markdown.get(hashlib.sha1(text.encode()).digest())
+            if html is not None:
+                return html
+        import commonmark
+        return commonmark.commonmark(text)
+    except ImportError as e:
+        err('WARNING: Cannot render Markdown in {}: {}', filename, str(e))
+        return text
+
+
+def commonmark_html(text):
+    """Render Markdown text with commonmark in a worker process."""
+    import commonmark
+    return commonmark.commonmark(text)
+
+
+class Body:
+    """Content body that is read and rendered only when first used."""
+
+    def __init__(self, filename, offset):
+        self.filename = filename
+        self.offset = offset
+        self.text = None
+
+    def source(self):
+        """Return the body text as written in the file."""
+        return fread(self.filename)[self.offset:]
+
+    def render(self, text):
+        """Render and keep the body source text, returning the result."""
+        if self.filename.endswith('.md'):
+            text = markdown(text, self.filename)
+        self.text = text
+        return text
+
+    def __str__(self):
+        if self.text is None:
+            self.render(self.source())
+        return self.text
+
+
+def read_content(filename, lazy=False, st=None):
+    """Read content and metadata from file into a dictionary.
+
+    If lazy is true only the header block is scanned up front and the
+    'content' value is a Body that loads the rest of the file on use;
+    otherwise the file is read once.
+    If given, st is the os.stat() result of the file, saving a lookup.
+    """
     # only process HTML and Markdown files
-    if not filename.endswith(('.html', '.md')) or os.path.isdir(filename):
+    if not filename.endswith(('.html', '.md')):
+        return None
+    if st is None:
+        st = os.stat(filename)
+    if stat.S_ISDIR(st.st_mode):
         return None
-
-    # Read file content.
-    text = fread(filename)
 
     # Read metadata and save it in a dictionary.
+    if lazy:
+        headers, end = scan_headers(filename)
+    else:
+        text = fread(filename)
+        headers, end = {}, 0
+        for key, val, end in read_headers(text):
+            headers[key] = val
     date_slug = os.path.basename(filename).split('.')[0]
     match = re.search(r'^(\d\d\d\d-\d\d-\d\d)-(.+)$', date_slug)
-    created = re.search(r'<!-- +created: +(.+?) +-->', text)
     if match:
         yymmdd = match.group(1)
         slug = match.group(2)
-    elif created:
-        yymmdd = created.group(1)
+    elif 'created' in headers:
+        yymmdd = headers['created']
         slug = date_slug
     else:
-        ts_epoch = os.path.getctime(filename)
+        ts_epoch = st.st_ctime
         yymmdd = datetime.datetime.fromtimestamp(ts_epoch).strftime('%Y-%m-%d')
         slug = date_slug
 
@@ -117,119 +401,303 @@ def read_content(filename):
         'subdir': f'{yymmdd[:7]}',
         'slug': slug
     }
-
-    # Read headers.
-    end = 0
-    for key, val, end in read_headers(text):
-        content[key] = val
-
-    # Separate content from headers.
-    text = text[end:]
-
-    # Convert Markdown content to HTML.
-    if filename.endswith(('.md')):
-        try:
-            if _test == 'ImportError':
-                raise ImportError('Error forced by test')
-            import commonmark
-            text = commonmark.commonmark(text)
-        except ImportError as e:
-            err('WARNING: Cannot render Markdown in {}: {}', filename, str(e))
+    content.update(headers)
 
     # Update the dictionary with content and RFC 2822 date.
+    body = Body(filename, end)
     content.update({
-        'content': text,
+        'content': body if lazy else body.render(text[end:]),
         'rfc_2822_date': rfc_2822_format(content['date'])
     })
 
     return content
 
 
-def render(template, **params):
-    """Replace placeholders in template with values from params."""
-    return re.sub(r'{{\s*([^}\s]+)\s*}}',
-                  lambda match:
-                  str(params.get(match.group(1), match.group(0))), template)
+def split_template(template):
+    """Split template into (text, key, placeholder) segments."""
+    segments = []
+    pos = 0
+    for match in re.finditer(r'{{\s*([^}\s]+)\s*}}', template):
+        segments.append((template[pos:match.start()], match.group(1),
+                         match.group(0)))
+        pos = match.end()
+    segments.append((template[pos:], None, None))
+    return tuple(segments)
+
+
+# Layouts are reused for every page, so their segments are cached; page
+# content rendered as a template goes through split_template() instead.
+compile_template = functools.lru_cache(maxsize=256)(split_template)
+
+
+def load_content(filename, st=None):
+    """Return read_content(filename, lazy=True), reusing unchanged entries.
+
+    Parsed headers and rendered bodies are kept in _contents, so a
+    long-running process such as the build daemon only re-reads files
+    whose mtime or size changed.  A shallow copy is returned because
+    pages add their own keys to it.
+    """
+    key = os.path.abspath(filename)
+    if st is None:
+        st = os.stat(key)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _contents.get(key)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, read_content(filename, lazy=True, st=st))
+        _contents[key] = cached
+    return dict(cached[1]) if cached[1] else None
+
+
+def forget_contents(content, keep=()):
+    """Drop _contents entries of files below content not named in keep."""
+    prefix = os.path.join(os.path.abspath(content), '')
+    for key in [key for key in _contents
+                if key.startswith(prefix) and key not in keep]:
+        del _contents[key]
+
+
+FileEntry = collections.namedtuple('FileEntry', 'path kind blog stat ext')
+
+
+def scan_content(content, blogdirs=()):
+    """Index the files below content in a single os.scandir() walk.
+
+    Return FileEntry tuples sorted by path.  kind is 'index' for the
+    top-level _index.html, 'page' for other top-level files not starting
+    with '_', 'post' for files below one of blogdirs (named in blog) and
+    'other' for the rest.  Hidden files and directories are skipped as
+    glob() does, and stat is the one os.stat() result of each file.
+    """
+    blogdirs = [d.strip('/') + '/' for d in blogdirs]
+    entries = []
+    stack = [(content, '')]
+    while stack:
+        dirpath, rel = stack.pop()
+        with os.scandir(dirpath) as it:
+            for entry in it:
+                if entry.name.startswith('.'):
+                    continue
+                relpath = rel + entry.name
+                if entry.is_dir():
+                    stack.append((entry.path, relpath + '/'))
+                    continue
+                blog = next((d[:-1] for d in blogdirs
+                             if relpath.startswith(d)), None)
+                if blog:
+                    kind = 'post'
+                elif rel:
+                    kind = 'other'
+                elif entry.name == '_index.html':
+                    kind = 'index'
+                elif entry.name.startswith('_'):
+                    kind = 'other'
+                else:
+                    kind = 'page'
+                entries.append(FileEntry(entry.path, kind, blog, entry.stat(),
+                                         os.path.splitext(entry.name)[1]))
+    return sorted(entries, key=lambda e: e.path)
+
+
+def glob_entries(pattern):
+    """Return FileEntry tuples, without stat results, for a glob pattern."""
+    return [FileEntry(filename, 'other', None, None,
+                      os.path.splitext(filename)[1])
+            for filename in glob.glob(pattern, recursive=True)]
+
+
+def render_to(out, template, params):
+    """Write template to out, replacing placeholders with params values.
+
+    Values with a write_to() method, such as Stream, write themselves.
+    """
+    render_segments(out, compile_template(template), params)
+
+
+def render_segments(out, segments, params):
+    """Write template segments to out, as render_to() does."""
+    for text, key, placeholder in segments:
+        out.write(text)
+        if key is not None:
+            value = params.get(key, placeholder)
+            if hasattr(value, 'write_to'):
+                value.write_to(out)
+            else:
+                out.write(str(value))
+
+
+def render(template, context=None, /, **params):
+    """Replace placeholders in template with values from params.
+
+    Keys missing from params are looked up in the context mapping, such
+    as a ChainMap of page values over site params, without copying it.
+    """
+    if context is not None:
+        params = collections.ChainMap(params, context)
+    out = io.StringIO()
+    render_to(out, template, params)
+    return out.getvalue()
+
+
+class Stream:
+    """Placeholder value produced piece by piece by write_to(out)."""
+
+    def __init__(self, write_to):
+        self.write_to = write_to
 
+    def __str__(self):
+        out = io.StringIO()
+        self.write_to(out)
+        return out.getvalue()
 
-def make_pages(src, dst, layout, **params):
-    """Generate pages from page content."""
+
+def make_pages(src, dst, layout, related_layout=None, alltags=None,
+               **params):
+    """Generate pages from page content.
+
+    If related_layout is given, each page gets a 'related' parameter
+    listing the pages that share the most tags with it.  Tags of the
+    pages are collected in alltags if given.  src is either a glob
+    pattern or a list of FileEntry tuples from scan_content().
+    """
     items = []
 
-    for src_path in glob.glob(src, recursive=True):
-        content = read_content(src_path)
-        if not content:
-            continue
+    if isinstance(src, str):
+        src = glob_entries(src)
+    pages = []
+    for entry in src:
+        content = load_content(entry.path, entry.stat)
+        if content:
+            pages.append((entry.path, content))
 
-        page_params = dict(params, **content)
+    if related_layout is not None:
+        make_related([content for _, content in pages], related_layout,
+                     int(params.get('related_count', 5)), params)
+
+    for src_path, content in pages:
+        # Page values layered over params; assignments go to the top map.
+        page_params = collections.ChainMap({}, content, params)
 
         # Populate placeholders in content if content-rendering is enabled.
         if page_params.get('render') == 'yes':
-            rendered_content = render(page_params['content'], **page_params)
+            out = io.StringIO()
+            render_segments(out, split_template(str(page_params['content'])),
+                            page_params)
+            rendered_content = out.getvalue()
             page_params['content'] = rendered_content
             content['content'] = rendered_content
 
         items.append(content)
 
-        dst_path = render(dst, **page_params)
+        dst_path = render(dst, page_params)
         page_params['tags_html'] = process_tags(src_path, dst_path,
-                                                **page_params)
-        output = render(layout, **page_params)
+                                                page_params, alltags)
 
         log('Rendering {} => {}', src_path, dst_path)
-        fwrite(dst_path, output)
+        with fopen(dst_path) as out:
+            render_to(out, layout, page_params)
 
     return sorted(items, key=lambda x: x['date'], reverse=True)
 
 
-def process_tags(src_path, dst_path, **params):
-    dst_path_parts = Path(dst_path).parts
+def related_posts(posts, k=5, window=50):
+    """Return for each post the indices of up to k posts sharing its tags.
+
+    Candidates are scored by the number of shared tags through an
+    inverted index of tag -> post ids, and ties favour earlier posts.
+    Posts are expected in date order; for each tag of a post only the
+    window posts nearest to it in that order are scored, so the work is
+    linear in posts x tags however popular a tag is.
+    """
+    postings = {}
+    post_tags = []
+    for i, post in enumerate(posts):
+        tags = set(post.get('tags', '').split())
+        post_tags.append(tags)
+        for tag in tags:
+            postings.setdefault(tag, array.array('I')).append(i)
+
+    related = []
+    for i, tags in enumerate(post_tags):
+        scores = collections.Counter()
+        for tag in tags:
+            ids = postings[tag]
+            pos = bisect.bisect_left(ids, i)
+            start = max(0, min(pos - window // 2, len(ids) - window - 1))
+            scores.update(ids[start:start + window + 1])
+        scores.pop(i, None)
+        top = heapq.nlargest(k, scores.items(),
+                             key=lambda item: (item[1], -item[0]))
+        related.append([j for j, _ in top])
+    return related
+
+
+def make_related(posts, item_layout, k=5, params=None):
+    """Set the 'related' HTML of each post from its related posts."""
+    params = params or {}
+    posts = sorted(posts, key=lambda x: x['date'], reverse=True)
+    for post, ids in zip(posts, related_posts(posts, k)):
+        if not ids:
+            post['related'] = ''
+            continue
+        items = ''.join(render(item_layout,
+                               collections.ChainMap(posts[j], params))
+                        for j in ids)
+        post['related'] = ('<section class="related">\n'
+                           '<h3>Related posts</h3>\n<ul>\n'
+                           f'{items}</ul>\n</section>')
+
+
+def process_tags(src_path, dst_path, params, alltags=None):
+    """Return tag links HTML for a page and record its tags in alltags."""
+    blogdir = params.get('blog', '')
     if 'tags' not in params:
         return ""
+    if alltags is None:
+        alltags = {}
     tags_html = '<p>Tags:'
     for tag in params.get('tags').split(' '):
-        if tag not in params['alltags']:
-            params['alltags'][tag] = {}
-        tagfile_web = f"/{dst_path_parts[1]}/tag_{tag}.html"
-        tagfile_local = f"{dst_path_parts[0]}/{tagfile_web}"
-        params['alltags'][tag]['url'] = tagfile_local
+        if tag not in alltags:
+            alltags[tag] = {}
+        tagfile_web = f"/{blogdir}/tag_{tag}.html"
+        tagfile_local = f"{_sink.root}{tagfile_web}"
+        alltags[tag]['url'] = tagfile_local
         tags_html += f'&nbsp;&nbsp;<a href="{tagfile_web}">{tag}</a>'
-        params['alltags'][tag][dst_path] = params['title']
+        alltags[tag][dst_path] = params['title']
     tags_html += '</p>'
     return tags_html
 
 
-def make_list(posts, dst, list_layout, item_layout, **params):
+def make_list(posts, dst, list_layout, item_layout, headings=False,
+              **params):
     """Generate list page for a blog."""
-    items = []
-    subdir = ""
-    for post in posts:
-        item_params = dict(params, **post)
-        if re.search(r"allposts.html", dst):
-            if item_params['subdir'] != subdir:
-                subdir = item_params['subdir']
-                date = datetime.datetime.strptime(subdir, '%Y-%m')
-                formatted_date = date.strftime('%B %Y')
-                subdir_html = f"<h3>{formatted_date}</h3><br>"
+    def write_items(out):
+        subdir = ""
+        for post in posts:
+            item_params = collections.ChainMap({}, post, params)
+            if headings or re.search(r"allposts.html", dst):
+                if item_params['subdir'] != subdir:
+                    subdir = item_params['subdir']
+                    date = datetime.datetime.strptime(subdir, '%Y-%m')
+                    formatted_date = date.strftime('%B %Y')
+                    out.write(f"<h3>{formatted_date}</h3><br>")
             else:
-                subdir_html = ""
-            item = subdir_html + render(item_layout, **item_params)
-        else:
-            item_params['summary'] = truncate(post['content'])
-            item = render(item_layout, **item_params)
-        items.append(item)
+                item_params['summary'] = truncate(str(post['content']))
+            render_to(out, item_layout, item_params)
 
-    params['content'] = ''.join(items)
-    dst_path = render(dst, **params)
-    output = render(list_layout, **params)
+    # Items are rendered straight into the output file as it is written.
+    params['content'] = Stream(write_items)
+    dst_path = render(dst, params)
 
     log('Rendering list => {} ...', dst_path)
-    fwrite(dst_path, output)
+    with fopen(dst_path) as out:
+        render_to(out, list_layout, params)
 
 
-def make_list_by_tag(posts, dst, list_layout, item_layout, **params):
+def make_list_by_tag(posts, dst, list_layout, item_layout, alltags,
+                     **params):
     """Generate list page for a single tag."""
-    for tag in params['alltags']:
+    for tag in alltags:
         posts_by_tag = []
         dst_by_tag = f"{dst}/tag_{tag}.html"
         for post in posts:
@@ -239,43 +707,98 @@ def make_list_by_tag(posts, dst, list_layout, item_layout, **params):
                   title=f"Posts tagged as '{tag}'", **params)
 
 
-def make_list_alltags(blogdir, dst, layout, **params):
+def make_list_alltags(blogdir, dst, layout, alltags, **params):
     """Generate list page for all tags."""
-    d = params['alltags']
-    html = "<!-- title: All tags -->\n<h1>All tags</h1>\n<p>\n  <ul>\n"
+    d = alltags
+    html = "<h1>All tags</h1>\n<p>\n  <ul>\n"
     for tag in d:
         n = len(d[tag]) - 1
         nstr = f"{n} posts" if n > 1 else "1 post"
         tagurl = f"/{blogdir}/tag_{tag}.html"
         html += f'    <li><a href="{tagurl}">{tag}</a> : {nstr}\n'
     html += "  </ul>\n</p>"
-    fwrite(dst, html)
-    make_pages(f"_site/{blogdir}/alltags.html",
-               f"_site/{blogdir}/alltags.html", layout, **params)
-    return
+    params.update(title='All tags', slug='alltags', content=html)
+    log('Rendering {} => {}', 'all tags', dst)
+    fwrite(dst, render(layout, params))
 
 
-def main(argv):
-    rootdir = argv[1] if len(argv) == 2 else "."
-    try:
-        os.chdir(rootdir)
-        if (
-                not os.path.isdir('content') or
-                not os.path.isdir('layout') or
-                not os.path.isdir('static')
-                ):
-            err(f"Root directory '{rootdir}' not a makesite directory")
-            sys.exit(1)
-    except FileNotFoundError:
-        err(f"Root directory '{rootdir}' does not exist")
-        sys.exit(1)
-
-    # Create a new _site directory from scratch
-    if os.path.isdir('_site'):
-        shutil.rmtree('_site')
-    shutil.copytree('static', '_site')
-
-    # Default parameters
+def archive_index(posts):
+    """Group posts into a year -> month -> posts index using their subdir."""
+    index = {}
+    for post in posts:
+        year, month = post['subdir'].split('-')
+        index.setdefault(year, {}).setdefault(month, []).append(post)
+    return index
+
+
+def archive_digests(index, salt=''):
+    """Return a digest per 'yyyy-mm' of the posts listed in that month.
+
+    Every value of every post counts, as does salt, which stands for
+    the layouts and params the pages are rendered with.
+    """
+    digests = {}
+    for year, months in index.items():
+        for month, posts in months.items():
+            h = hashlib.sha1(salt.encode())
+            for post in posts:
+                for key in sorted(post):
+                    h.update(f'{key}\0{post[key]}\0'.encode())
+                h.update(b'\n')
+            digests[f'{year}-{month}'] = h.hexdigest()
+    return digests
+
+
+def changed_months(old, new):
+    """Return the 'yyyy-mm' keys whose archive digests differ."""
+    return {m for m in old.keys() | new.keys() if old.get(m) != new.get(m)}
+
+
+def make_archive(posts, blogdir, list_layout, item_layout, months=None,
+                 **params):
+    """Generate per-year, per-month and overview archive pages for a blog.
+
+    If months is given, only those 'yyyy-mm' pages and their year pages
+    are regenerated, provided the sink can keep the other pages from the
+    last build; the overview is always regenerated.
+    """
+    index = archive_index(posts)
+    base = params.get('base_path', '')
+    overview = '<ul>\n'
+    for year in sorted(index, reverse=True):
+        year_posts = [post for month in sorted(index[year], reverse=True)
+                      for post in index[year][month]]
+        links = []
+        for month in sorted(index[year], reverse=True):
+            subdir = f'{year}-{month}'
+            name = datetime.datetime.strptime(subdir, '%Y-%m').strftime('%b')
+            links.append(f'<a href="{base}/{blogdir}/{subdir}/">{name}</a>'
+                         f' ({len(index[year][month])})')
+            dst = os.path.join(_sink.root, blogdir, subdir, 'index.html')
+            if months is None or subdir in months or not _sink.keep(dst):
+                title = datetime.datetime.strptime(subdir, '%Y-%m')
+                make_list(index[year][month], dst, list_layout, item_layout,
+                          blog=blogdir,
+                          title=title.strftime('Archive: %B %Y'), **params)
+        dst = os.path.join(_sink.root, blogdir, year, 'index.html')
+        if (months is None or any(m[:4] == year for m in months)
+                or not _sink.keep(dst)):
+            make_list(year_posts, dst, list_layout, item_layout,
+                      headings=True, blog=blogdir, title=f'Archive: {year}',
+                      **params)
+        overview += (f'  <li><a href="{base}/{blogdir}/{year}/">{year}</a>'
+                     f' ({len(year_posts)}): ' + ', '.join(links) + '\n')
+    overview += '</ul>\n'
+
+    params['content'] = overview
+    dst_path = os.path.join(_sink.root, blogdir, 'archive.html')
+    log('Rendering archive => {} ...', dst_path)
+    fwrite(dst_path, render(list_layout, blog=blogdir, title='Archive',
+                            **params))
+
+
+def load_params(rootdir='.'):
+    """Return default parameters updated from params.json if it exists."""
     params = {
         'base_path': '',
         'subtitle': 'Lorem Ipsum',
@@ -289,72 +812,839 @@ def main(argv):
     }
 
     # If params.json exists, load it
-    if os.path.isfile('params.json'):
-        params.update(json.loads(fread('params.json')))
+    filename = os.path.join(rootdir, 'params.json')
+    if os.path.isfile(filename):
+        params.update(json.loads(fread(filename)))
+    return params
+
+
+class FileCache:
+    """Thread-safe LRU cache of file bodies and their strong ETags."""
+
+    def __init__(self, maxbytes=64 * 1024 * 1024):
+        self.maxbytes = maxbytes
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        import threading
+        self.lock = threading.Lock()
+
+    def get(self, filename, compress=False, files=None):
+        """Return (body, etag) for file, gzip-compressed if requested.
+
+        The file is read from disk, or from the files dict of a
+        MemorySink if given; there the bytes themselves are the stamp.
+        An uncompressed disk file larger than maxbytes is returned as an
+        open binary file instead, with an ETag made from its stat result.
+        """
+        if files is None:
+            st = os.stat(filename)
+            stamp = (st.st_mtime_ns, st.st_size)
+            if st.st_size > self.maxbytes and not compress:
+                return open(filename, 'rb'), '"{:x}-{:x}"'.format(*stamp)
+        else:
+            stamp = files[filename]
+        key = (filename, compress, files is None)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == stamp:
+                self.entries.move_to_end(key)
+                return entry[1], entry[2]
+
+        if files is None:
+            with open(filename, 'rb') as f:
+                body = f.read()
+        else:
+            body = stamp
+        if compress:
+            import gzip
+            body = gzip.compress(body, mtime=0)
+        etag = etag_for(body)
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old:
+                self.size -= len(old[1])
+            if len(body) <= self.maxbytes:
+                self.entries[key] = (stamp, body, etag)
+                self.size += len(body)
+            while self.size > self.maxbytes:
+                _, (_, old_body, _) = self.entries.popitem(last=False)
+                self.size -= len(old_body)
+        return body, etag
+
+
+def etag_for(body):
+    """Return a strong ETag for a response body."""
+    return '"{}"'.format(hashlib.blake2b(body, digest_size=16).hexdigest())
+
+
+def accepted_encodings(header):
+    """Return the codings an Accept-Encoding header allows, by q-value.
+
+    Codings with q=0 are excluded, and '*' stands for any coding not
+    listed explicitly.
+    """
+    weights = {}
+    for item in header.split(','):
+        coding, *items = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in items:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding.lower()] = q
+    wildcard = weights.pop('*', 0.0)
+    return {coding for coding in ('br', 'gzip')
+            if weights.get(coding, wildcard) > 0}
+
+
+class PreviewHandler:
+    """Serve files with ETags, 304 responses and gzip/br encodings.
+
+    Mixed into http.server.SimpleHTTPRequestHandler by make_server().
+    Files come from the served directory, or from the files dict of a
+    MemorySink when files is set.
+    """
+
+    cache = None
+    files = None
+    compressible = ('text/', 'application/javascript', 'application/json',
+                    'application/xml', 'application/rss+xml', 'image/svg+xml')
+
+    def send_head(self):
+        urlpath = self.path.split('?', 1)[0].split('#', 1)[0]
+        if self.files is None:
+            path = self.translate_path(self.path)
+            if os.path.isdir(path):
+                index = os.path.join(path, 'index.html')
+                if not urlpath.endswith('/') or not os.path.isfile(index):
+                    return super().send_head()
+                path = index
+            exists, load = os.path.isfile, self.cache.get
+        else:
+            import urllib.parse
+            path = urllib.parse.unquote(urlpath).lstrip('/')
+            if path == '' or path.endswith('/'):
+                path += 'index.html'
+            elif path not in self.files and path + '/index.html' in self.files:
+                self.send_response(301)
+                self.send_header('Location', urlpath + '/')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+            exists = self.files.__contains__
+            load = functools.partial(self.cache.get, files=self.files)
+        if not exists(path):
+            self.send_error(404, "File not found")
+            return None
+
+        ctype = self.guess_type(path)
+        accept = accepted_encodings(self.headers.get('Accept-Encoding', ''))
+        encoding = None
+        filename = path
+        for name, ext in (('br', '.br'), ('gzip', '.gz')):
+            if name in accept and exists(path + ext):
+                encoding, filename = name, path + ext
+                break
+        compress = (encoding is None and 'gzip' in accept and
+                    ctype.startswith(self.compressible))
+        if compress and self.files is None:
+            # Files too large to cache are streamed as they are
+            compress = os.path.getsize(filename) <= self.cache.maxbytes
+        if compress:
+            encoding = 'gzip'
+
+        try:
+            body, etag = load(filename, compress)
+        except (OSError, KeyError):
+            self.send_error(404, "File not found")
+            return None
+        if isinstance(body, bytes):
+            length, body = len(body), io.BytesIO(body)
+        else:
+            length = os.fstat(body.fileno()).st_size
+
+        inm = self.headers.get('If-None-Match', '')
+        if inm.strip() == '*' or etag in [t.strip() for t in inm.split(',')]:
+            body.close()
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return None
+
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(length))
+        self.send_header('ETag', etag)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Cache-Control', 'no-cache')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        return body
+
+
+def make_server(sitedir='_site', host='', port=8000, files=None):
+    """Create a threaded preview server for a site directory or dict."""
+    import http.server
+
+    class Handler(PreviewHandler, http.server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=sitedir, **kwargs)
+
+    Handler.cache = FileCache()
+    Handler.files = files
+    return http.server.ThreadingHTTPServer((host, port), Handler)
+
+
+def serve(argv):
+    """Serve the site: makesite.py serve [--memory] [port].
+
+    With --memory the site is first built into memory and served from
+    there, leaving _site untouched.
+    """
+    files = None
+    if argv and argv[0] == '--memory':
+        argv = argv[1:]
+        sink = MemorySink()
+        make_site('.', sink)
+        files = sink.files
+    elif not os.path.isdir('_site'):
+        err("Directory '_site' does not exist; build the site first")
+        sys.exit(1)
+    port = int(argv[0]) if argv else 8000
+    httpd = make_server('_site', port=port, files=files)
+    log('Serving _site on http://localhost:{}/ ...', port)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+def open_archive(filename):
+    """Return an ArchiveSink for a .zip, .tar, .tar.gz/.tgz or .tar.xz file.
+
+    A filename of '-' streams an uncompressed tar archive to stdout.
+    """
+    if filename == '-':
+        return ArchiveSink(sys.stdout.buffer)
+    f = open(filename, 'wb')
+    if filename.endswith('.zip'):
+        return ArchiveSink(f, 'zip', closefd=True)
+    for ext, compression in (('.gz', 'gz'), ('.tgz', 'gz'), ('.bz2', 'bz2'),
+                             ('.xz', 'xz')):
+        if filename.endswith(ext):
+            return ArchiveSink(f, 'tar', compression, closefd=True)
+    return ArchiveSink(f, closefd=True)
+
+
+def cmd_archive(argv):
+    """Build the site into an archive: makesite.py archive <file|->."""
+    if len(argv) != 1:
+        err("Usage: makesite.py archive <file.tar[.gz]|file.zip|->")
+        sys.exit(2)
+    stdout = sys.stdout
+    sink = open_archive(argv[0])
+    if argv[0] == '-':
+        sys.stdout = sys.stderr     # keep log messages out of the archive
+    try:
+        make_site('.', sink)
+    finally:
+        sink.close()
+        sys.stdout = stdout
+
+
+link_re = re.compile(r"""\b(?:href|src)\s*=\s*(?:"([^"]*)"|'([^']*)')""", re.I)
+anchor_re = re.compile(
+    r"""\b(?:id|name)\s*=\s*(?:"([^"]*)"|'([^']*)')""", re.I)
+
+
+def scan_html(filename):
+    """Return (anchors, links) found in an HTML file outside comments."""
+    import html
+    with open(filename, 'r', errors='replace') as f:
+        text = re.sub(r'(?s)<!--.*?-->', '', f.read())
+    anchors = {html.unescape(a or b) for a, b in anchor_re.findall(text)}
+    links = {html.unescape(a or b) for a, b in link_re.findall(text)}
+    return anchors, links
+
+
+def check_links(sitedir='_site', base_path='', site_url='', workers=None):
+    """Return sorted (page, link) pairs of broken internal links."""
+    paths = set()
+    for dirpath, _, filenames in os.walk(sitedir):
+        rel = os.path.relpath(dirpath, sitedir)
+        for name in filenames:
+            paths.add(name if rel == '.' else f'{rel}/{name}'.replace(os.sep,
+                                                                      '/'))
+    pages = sorted(p for p in paths if p.endswith(('.html', '.htm')))
+
+    import urllib.parse
+    from concurrent.futures import ProcessPoolExecutor
+    files = [os.path.join(sitedir, p) for p in pages]
+    with ProcessPoolExecutor(workers) as pool:
+        scans = dict(zip(pages, pool.map(scan_html, files,
+                                         chunksize=max(1, len(files) // 64))))
+
+    site_url = site_url.rstrip('/')
+    resolved = {}
+
+    def resolve(page, link):
+        """Return (output path, fragment) for an internal link, else None."""
+        url = link
+        if site_url and url.startswith(site_url + '/'):
+            url = url[len(site_url):]
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme or parts.netloc:
+            return None
+        target = urllib.parse.unquote(parts.path)
+        if not target:
+            target = '/' + page
+        elif not target.startswith('/'):
+            target = posixpath.join('/' + posixpath.dirname(page), target)
+        isdir = target.endswith(('/', '/.', '/..'))
+        target = posixpath.normpath(target)
+        if isdir and target != '/':
+            target += '/'
+        if base_path:
+            if target != base_path and not target.startswith(base_path + '/'):
+                return '', parts.fragment    # outside the site: broken
+            target = target[len(base_path):]
+        target = target.lstrip('/')
+        if target == '' or target.endswith('/'):
+            target += 'index.html'
+        elif target not in paths and target + '/index.html' in paths:
+            target += '/index.html'
+        return target, parts.fragment
+
+    broken = []
+    for page, (_, links) in scans.items():
+        pagedir = posixpath.dirname(page)
+        for link in links:
+            # Links resolve the same way on every page if absolute, and
+            # on every page of a directory unless they only hold a
+            # query or fragment.
+            if link.startswith('/'):
+                key = link
+            elif link[:1] in ('', '#', '?'):
+                key = (page, link)
+            else:
+                key = (pagedir, link)
+            if key not in resolved:
+                resolved[key] = resolve(page, link)
+            if resolved[key] is None:
+                continue
+            target, fragment = resolved[key]
+            if target not in paths:
+                broken.append((page, link))
+            elif (fragment and target in scans and
+                    fragment not in scans[target][0]):
+                broken.append((page, link))
+    return sorted(broken)
+
+
+def cmd_check_links(argv):
+    """Report broken internal links: makesite.py check-links [sitedir]."""
+    sitedir = argv[0] if argv else '_site'
+    if not os.path.isdir(sitedir):
+        err(f"Directory '{sitedir}' does not exist; build the site first")
+        sys.exit(1)
+    params = load_params()
+    broken = check_links(sitedir, params['base_path'], params['site_url'])
+    for page, link in broken:
+        err('{}: broken link: {}', page, link)
+    log('Checked links: {} broken', len(broken))
+    if broken:
+        sys.exit(1)
 
+
+manifest_name = '.manifest.json'
+archive_name = '.archive.json'
+
+
+def read_manifest(sitedir, name=manifest_name):
+    """Return the manifest recorded in sitedir, or {} if there is none."""
+    filename = os.path.join(sitedir, name)
+    if not os.path.isfile(filename):
+        return {}
+    return json.loads(fread(filename))
+
+
+def prune(sitedir, manifest):
+    """Remove files and empty directories of sitedir not in manifest."""
+    keep = manifest.keys() | {manifest_name, archive_name}
+    for dirpath, _, filenames in os.walk(sitedir, topdown=False):
+        for name in filenames:
+            filename = os.path.join(dirpath, name)
+            if relname(filename, sitedir) not in keep:
+                os.remove(filename)
+        if dirpath != sitedir and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+
+
+def publish(sitedir, dest):
+    """Publish sitedir to dest, copying only files changed since last time.
+
+    dest is a symlink to a release directory next to it.  The new release
+    is assembled with unchanged files hard-linked from the current one,
+    and then the symlink is swapped to it with os.replace(), so dest
+    always names a complete tree.  A plain directory at dest is moved
+    aside once to make room for the symlink; a symlink to anything but
+    a release is replaced, leaving its target alone.  Return (copied,
+    unchanged, removed) path lists.
+    """
+    new = read_manifest(sitedir)
+    if not new:
+        raise FileNotFoundError(f"No manifest in '{sitedir}'; rebuild site")
+    dest = os.path.abspath(dest)    # also drops a trailing slash
+    old = read_manifest(dest) if os.path.isdir(dest) else {}
+
+    parent, name = os.path.split(dest)
+    release_re = re.compile(re.escape(f'.{name}.') + r'\d+')
+    release = os.path.join(parent, f'.{name}.{time.time_ns()}')
+
+    # Name of the release dest links to, if it is one of ours
+    current = None
+    if os.path.islink(dest):
+        target = os.path.realpath(dest)
+        if (os.path.dirname(target) == os.path.realpath(parent) and
+                release_re.fullmatch(os.path.basename(target))):
+            current = os.path.basename(target)
+
+    # Drop releases left behind by an interrupted publish
+    with os.scandir(parent) as it:
+        for entry in it:
+            if release_re.fullmatch(entry.name) and entry.name != current:
+                shutil.rmtree(entry.path)
+
+    copied, unchanged = [], []
+    for path, digest in sorted(new.items()):
+        src, dst = os.path.join(sitedir, path), os.path.join(release, path)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        prev = os.path.join(dest, path)
+        if old.get(path) == digest and os.path.isfile(prev):
+            try:
+                os.link(prev, dst)
+            except OSError:
+                shutil.copy2(prev, dst)
+            unchanged.append(path)
+        else:
+            shutil.copy2(src, dst)
+            copied.append(path)
+    shutil.copy2(os.path.join(sitedir, manifest_name),
+                 os.path.join(release, manifest_name))
+
+    if not os.path.islink(dest) and os.path.isdir(dest):
+        current = f'.{name}.0'
+        os.rename(dest, os.path.join(parent, current))
+    link = os.path.join(parent, f'.{name}.link')
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(release), link)
+    os.replace(link, dest)
+    if current:
+        shutil.rmtree(os.path.join(parent, current))
+    return copied, unchanged, sorted(old.keys() - new.keys())
+
+
+def cmd_publish(argv):
+    """Publish _site to a directory: makesite.py publish <dest>."""
+    if len(argv) != 1:
+        err("Usage: makesite.py publish <dest>")
+        sys.exit(2)
+    try:
+        copied, unchanged, removed = publish('_site', argv[0])
+    except FileNotFoundError as e:
+        err(str(e))
+        sys.exit(1)
+    for path in copied:
+        log('Copying {}', path)
+    for path in removed:
+        log('Removing {}', path)
+    log('Published to {}: {} copied, {} unchanged, {} removed', argv[0],
+        len(copied), len(unchanged), len(removed))
+
+
+socket_name = '.makesite.sock'
+connect_timeout = 2.0
+
+
+class DaemonHandler:
+    """Build the site named in a JSON request line and reply with JSON.
+
+    Mixed into socketserver.StreamRequestHandler by make_daemon().
+    """
+
+    def handle(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        status = 1
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            try:
+                rootdir = json.loads(self.rfile.readline())['root']
+                if not isinstance(rootdir, str):
+                    raise TypeError('root is not a string')
+            except (ValueError, LookupError, TypeError) as e:
+                err('Bad request: {}', repr(e))
+            else:
+                problem = check_root(rootdir)
+                if problem:
+                    err(problem)
+                else:
+                    try:
+                        make_site(rootdir)
+                        status = 0
+                    except Exception as e:
+                        err('Build failed: {}', repr(e))
+        reply = {'status': status, 'stdout': stdout.getvalue(),
+                 'stderr': stderr.getvalue(),
+                 'elapsed': time.perf_counter() - start}
+        self.wfile.write(json.dumps(reply).encode() + b'\n')
+
+
+def make_daemon(path):
+    """Create a build daemon server listening on the Unix socket path."""
+    import socketserver
+
+    class Handler(DaemonHandler, socketserver.StreamRequestHandler):
+        pass
+
+    return socketserver.UnixStreamServer(path, Handler)
+
+
+def daemon(argv):
+    """Serve warm builds over a Unix socket: makesite.py daemon [socket]."""
+    import signal
+    import socket
+    path = os.path.abspath(argv[0] if argv else socket_name)
+    if os.path.exists(path):
+        try:
+            with socket.socket(socket.AF_UNIX) as s:
+                s.connect(path)
+            err(f"Daemon already listening on '{path}'")
+            sys.exit(1)
+        except OSError:
+            os.remove(path)     # stale socket from a daemon that died
+    server = make_daemon(path)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    log('Build daemon listening on {} ...', path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(path)
+
+
+def client(argv):
+    """Build via the daemon if it runs: makesite.py client [rootdir].
+
+    Without a daemon listening on rootdir/.makesite.sock, or one taking
+    the request within connect_timeout seconds, the site is built in
+    this process instead.
+    """
+    import socket
+    rootdir = os.path.abspath(argv[0] if argv else '.')
+    request = json.dumps({'root': rootdir}).encode() + b'\n'
+    try:
+        with socket.socket(socket.AF_UNIX) as s:
+            # socket.timeout is an OSError, so it falls back like the rest
+            s.settimeout(connect_timeout)
+            s.connect(os.path.join(rootdir, socket_name))
+            s.sendall(request)
+            s.settimeout(None)      # a build may take a while
+            with s.makefile('rb') as f:
+                reply = json.loads(f.readline())
+    except (OSError, ValueError):
+        main(['makesite.py', rootdir])
+        return
+    sys.stdout.write(reply['stdout'])
+    sys.stderr.write(reply['stderr'])
+    log('Built by daemon in {:.3f}s', reply['elapsed'])
+    if reply['status']:
+        sys.exit(reply['status'])
+
+
+def prerender_markdown(rootdirs, pool):
+    """Render the Markdown bodies of all sites in parallel into _markdown.
+
+    Only files that are built into pages are rendered.  Return a dict
+    mapping each rootdir to the _markdown keys of its files.
+    """
+    texts = {}
+    keys = {}
+    for rootdir in rootdirs:
+        params = load_params(rootdir)
+        blogdirs = [blog['dir'] for blog in params['blogs'].values()]
+        keys[rootdir] = set()
+        for entry in scan_content(os.path.join(rootdir, 'content'), blogdirs):
+            if entry.ext != '.md' or entry.kind == 'other':
+                continue
+            content = load_content(entry.path, entry.stat)
+            if not content:
+                continue
+            text = content['content'].source()
+            key = hashlib.sha1(text.encode()).digest()
+            keys[rootdir].add(key)
+            if key not in _markdown:
+                texts[key] = text
+    pending = list(texts)
+    html = pool.map(commonmark_html, [texts[key] for key in pending],
+                    chunksize=max(1, len(pending) // 64))
+    _markdown.update(zip(pending, html))
+    return keys
+
+
+def batch(argv):
+    """Build many sites in one process: makesite.py batch [-f list] [root...].
+
+    A list file names one site root per line, relative to the list file;
+    blank lines and lines starting with '#' are ignored.  Markdown of all
+    sites is rendered up front by one shared worker pool.
+    """
+    rootdirs = []
+    while argv:
+        if argv[0] == '-f' and len(argv) > 1:
+            basedir = os.path.dirname(argv[1])
+            for line in fread(argv[1]).splitlines():
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    rootdirs.append(os.path.join(basedir, line))
+            argv = argv[2:]
+        else:
+            rootdirs.append(argv[0])
+            argv = argv[1:]
+    if not rootdirs:
+        err("Usage: makesite.py batch [-f sites.txt] [rootdir ...]")
+        sys.exit(2)
+
+    start = time.perf_counter()
+    valid = [rootdir for rootdir in rootdirs if not check_root(rootdir)]
+    keys = {}
+    import importlib.util
+    if importlib.util.find_spec('commonmark') and _test != 'ImportError':
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor() as pool:
+            keys = prerender_markdown(valid, pool)
+
+    # Markdown HTML is dropped after the last site that uses it is built
+    last_use = {key: rootdir for rootdir in valid
+                for key in keys.get(rootdir, ())}
+
+    timings = []
+    failed = 0
+    for rootdir in rootdirs:
+        problem = check_root(rootdir)
+        if problem:
+            err(problem)
+            failed += 1
+            continue
+        site_start = time.perf_counter()
+        try:
+            make_site(rootdir)
+        except Exception as e:
+            err('Build of {} failed: {}', rootdir, repr(e))
+            failed += 1
+            continue
+        finally:
+            forget_contents(os.path.join(rootdir, 'content'))
+            for key in keys.get(rootdir, ()):
+                if last_use[key] == rootdir:
+                    _markdown.pop(key, None)
+        timings.append((rootdir, time.perf_counter() - site_start))
+
+    for rootdir, elapsed in timings:
+        log('{:8.3f}s  {}', elapsed, rootdir)
+    log('Built {} of {} sites in {:.3f}s', len(timings), len(rootdirs),
+        time.perf_counter() - start)
+    if failed:
+        sys.exit(1)
+
+
+commands = {
+    'serve': serve,
+    'check-links': cmd_check_links,
+    'publish': cmd_publish,
+    'archive': cmd_archive,
+    'daemon': daemon,
+    'client': client,
+    'batch': batch,
+}
+
+
+def check_root(rootdir):
+    """Return an error message if rootdir is not a makesite directory."""
+    if not os.path.isdir(rootdir):
+        return f"Root directory '{rootdir}' does not exist"
+    for d in ('content', 'layout', 'static'):
+        if not os.path.isdir(os.path.join(rootdir, d)):
+            return f"Root directory '{rootdir}' not a makesite directory"
+    return None
+
+
+def main(argv):
+    if len(argv) > 1 and argv[1] in commands:
+        commands[argv[1]](argv[2:])
+        return
+
+    rootdir = argv[1] if len(argv) == 2 else "."
+    problem = check_root(rootdir)
+    if problem:
+        err(problem)
+        sys.exit(1)
+
+    make_site(rootdir)
+
+
+def make_site(rootdir='.', sink=None):
+    """Generate the site in rootdir/_site through sink, a DirSink by default.
+
+    All paths are relative to rootdir; the working directory is not
+    changed, so several sites can be built in one process.
+    """
+    global _sink
+
+    def path(*paths):
+        return os.path.normpath(os.path.join(rootdir, *paths))
+
+    site = path('_site')
+    saved_sink, _sink = _sink, sink or DirSink()
+    _sink.root = site
+    _sink.manifest.clear()
+    archive = {}
+    if isinstance(_sink, DirSink):
+        # Output of the last build may be kept where it is still current
+        _sink.previous = read_manifest(site)
+        archive = read_manifest(site, archive_name)
+    try:
+        copy_static(path('static'), site)
+        params = load_params(rootdir)
+        blogdirs = [blog['dir'] for blog in params['blogs'].values()]
+        index = scan_content(path('content'), blogdirs)
+        forget_contents(path('content'),
+                        {os.path.abspath(entry.path) for entry in index})
+        archive = build_pages(path, site, index, params, archive)
+
+        # Record output paths and content hashes for delta publishing
+        fwrite(os.path.join(site, manifest_name),
+               json.dumps(_sink.manifest, indent=0, sort_keys=True))
+
+        # Keep archive digests and remove whatever the last build left
+        # that was not generated now; only a DirSink builds on its output
+        if isinstance(_sink, DirSink):
+            fwrite(os.path.join(site, archive_name),
+                   json.dumps(archive, indent=0, sort_keys=True))
+            prune(site, _sink.manifest)
+    finally:
+        _sink = saved_sink
+
+
+def build_pages(path, site, index, params, archive=None):
+    """Generate all pages, lists and feeds of a site from its file index.
+
+    archive maps blog directories to the month digests of their archive
+    pages in the last build; the digests of this build are returned.
+    """
+    archive = archive or {}
+    digests = {}
     # Load layouts
-    page_layout = fread('layout/page.html')
-    post_layout = fread('layout/post.html')
-    list_layout = fread('layout/list.html')
-    item_layout = fread('layout/item.html')
-    allposts_layout = fread('layout/allposts.html')
-    feed_xml = fread('layout/feed.xml')
-    item_xml = fread('layout/item.xml')
+    page_layout = fread(path('layout/page.html'))
+    post_layout = fread(path('layout/post.html'))
+    list_layout = fread(path('layout/list.html'))
+    item_layout = fread(path('layout/item.html'))
+    related_layout = fread(path('layout/related.html'))
+    allposts_layout = fread(path('layout/allposts.html'))
+    feed_xml = fread(path('layout/feed.xml'))
+    item_xml = fread(path('layout/item.xml'))
 
     # Combine layouts to form final layouts
     post_layout = render(page_layout, content=post_layout)
     list_layout = render(page_layout, content=list_layout)
 
     # Create site pages
-    make_pages('content/_index.html', '_site/index.html',
-               page_layout, **params)
-    make_pages('content/[!_]*.html', '_site/{{ slug }}/index.html',
-               page_layout, **params)
-    make_pages('content/[!_]*.md', '_site/{{ slug }}/index.html',
+    make_pages([e for e in index if e.kind == 'index'], f'{site}/index.html',
                page_layout, **params)
+    make_pages([e for e in index if e.kind == 'page'],
+               site + '/{{ slug }}/index.html', page_layout, **params)
 
     # loop through each blog defined in params
     for key, blog in params['blogs'].items():
 
-        params['alltags'] = {}
+        # Tags of this blog's posts, collected as the posts are rendered
+        alltags = {}
 
         # Check if source content directory exists
-        if not os.path.isdir(f"content/{blog['dir']}"):
+        if not os.path.isdir(path('content', blog['dir'])):
             err(f"WARNING: directory does not exist: content/", blog['dir'])
 
         # Create blog
-        blog_posts = make_pages(f"content/{blog['dir']}/**/*",
-                                f"_site/{blog['dir']}/"
+        posts = [e for e in index if e.blog == blog['dir'].strip('/')]
+        blog_posts = make_pages(posts,
+                                f"{site}/{blog['dir']}/"
                                 + "{{ subdir }}/{{ slug }}/index.html",
-                                post_layout, blog=blog['dir'], **params)
+                                post_layout, related_layout, alltags,
+                                blog=blog['dir'], **params)
 
         # Create blog list page
-        make_list(blog_posts, f"_site/{blog['dir']}/index.html",
+        make_list(blog_posts, f"{site}/{blog['dir']}/index.html",
                   list_layout, item_layout,
                   blog=blog['dir'], title=blog['name'], **params)
 
-        make_list(blog_posts, f"_site/{blog['dir']}/allposts.html",
+        make_list(blog_posts, f"{site}/{blog['dir']}/allposts.html",
                   list_layout, allposts_layout,
                   blog=blog['dir'], title="All Posts", **params)
 
+        # Create per-year and per-month archive pages, only regenerating
+        # the months whose posts, layouts or params changed
+        salt = repr((list_layout, allposts_layout, params))
+        digests[blog['dir']] = archive_digests(archive_index(blog_posts),
+                                               salt)
+        months = None
+        if blog['dir'] in archive:
+            months = changed_months(archive[blog['dir']],
+                                    digests[blog['dir']])
+        make_archive(blog_posts, blog['dir'], list_layout, allposts_layout,
+                     months, **params)
+
         # Create blog list page for each tag
-        make_list_by_tag(blog_posts, f"_site/{blog['dir']}/",
-                         list_layout, item_layout,
+        make_list_by_tag(blog_posts, f"{site}/{blog['dir']}/",
+                         list_layout, item_layout, alltags,
                          blog=blog['dir'], **params)
 
         # Create page with consolidated list of all tags
-        make_list_alltags(blog['dir'], f"_site/{blog['dir']}/alltags.html",
-                          page_layout, **params)
+        make_list_alltags(blog['dir'], f"{site}/{blog['dir']}/alltags.html",
+                          page_layout, alltags, **params)
 
         # Create RSS feed
-        make_list(blog_posts, f"_site/{blog['dir']}/rss.xml",
+        make_list(blog_posts, f"{site}/{blog['dir']}/rss.xml",
                   feed_xml, item_xml,
                   blog=blog['dir'], title=blog['name'], **params)
 
+    return digests
+
 
 # Test parameter to be set temporarily by unit tests
 _test = None
 
+# Absolute content paths mapped to ((mtime, size), content) for reuse
+_contents = {}
+
+# Markdown sources (by SHA-1) mapped to HTML rendered ahead by batch()
+_markdown = {}
+
+# Destination of all generated files; see DirSink, MemorySink, ArchiveSink
+_sink = DirSink()
+
 
 if __name__ == '__main__':
     main(sys.argv)
@@ -62,6 +62,7 @@ get_json_param () {
 REMOTE_USER="$(get_json_param "remote_user")"
 REMOTE_HOST="$(get_json_param "remote_host")"
 REMOTE_PATH="$(get_json_param "remote_path")"
+LOCAL_WWW="$(get_json_param "local_www")"   # publish to local dir instead
 
 # these are used by makesite.py, and used in this script only for (V)iew post
 SITE_URL="$(get_json_param "site_url")"
@@ -364,7 +365,16 @@ cmd_rebuild () {
   # rsync --delete -rtzvcl "$d_site/" "${LOCAL_WWW}/${d_site}"  # -ravc
   # Two other alternatives are (1) _site is a symbolic link, or (2) change
   # makesite.py to output directly into the local webserver root directory
-  ./makesite.py  > /dev/null
+  # the client hands the build to a warm 'ss.sh daemon' if one is running
+  # and falls back to a normal build otherwise
+  ./makesite.py client > /dev/null
+}
+
+# ----------------------------------------------------------------------------
+cmd_daemon () {
+  [ $# -eq 0 ] || die "'daemon' expected 0 parameters, but got $#"
+
+  ./makesite.py daemon
 }
 
 # ----------------------------------------------------------------------------
@@ -378,6 +388,13 @@ cmd_rebuild () {
 cmd_publish () {
   [ $# -eq 0 ] || die "'publish' expected 0 parameters, but got $#"
 
+  # local web root: copy only files whose hashes changed since last publish
+  if [ -n "$LOCAL_WWW" ]; then
+    cmd_rebuild
+    ./makesite.py publish "$LOCAL_WWW"
+    return
+  fi
+
   [ -z "$REMOTE_USER" ] && die "Set 'REMOTE_USER=' in 'params.json'"
   [ -z "$REMOTE_HOST" ] && die "Set 'REMOTE_HOST=' in 'params.json'"
   [ -z "$REMOTE_PATH" ] && die "Set 'REMOTE_PATH=' in 'params.json'"
@@ -401,6 +418,7 @@ cat <<- EOF
 	    "$pgm" tags <pattern>                     [case sensitive]
 	    "$pgm" publish
 	    "$pgm" rebuild
+	    "$pgm" daemon                             [keep builds warm]
 	    "$pgm" help
 EOF
 }
@@ -446,6 +464,7 @@ main () {
     tags)      cmd_tags "$@";;
     publish )  cmd_publish "$@";;
     rebuild )  cmd_rebuild "$@";;
+    daemon )   cmd_daemon "$@";;
     help )     show_usage; exit 2;;
     * )     die "Illegal command: '$cmd'";;
   esac
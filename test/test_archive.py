@@ -0,0 +1,127 @@
+import unittest
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+
+import makesite
+from test import path
+
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.root_path = path.temppath('archive_root')
+        os.makedirs(self.root_path)
+        os.chdir(self.root_path)
+        self.posts = [
+            {'date': '2018-02-01', 'subdir': '2018-02', 'slug': 'c',
+             'title': 'C', 'content': ''},
+            {'date': '2018-01-02', 'subdir': '2018-01', 'slug': 'b',
+             'title': 'B', 'content': ''},
+            {'date': '2017-12-31', 'subdir': '2017-12', 'slug': 'a',
+             'title': 'A', 'content': ''},
+        ]
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.root_path)
+
+    def read(self, *paths):
+        with open(os.path.join('_site', 'blog', *paths)) as f:
+            return f.read()
+
+    def test_index(self):
+        index = makesite.archive_index(self.posts)
+        self.assertEqual(sorted(index), ['2017', '2018'])
+        self.assertEqual(sorted(index['2018']), ['01', '02'])
+        self.assertEqual(index['2017']['12'][0]['slug'], 'a')
+
+    def test_pages(self):
+        makesite.make_archive(self.posts, 'blog', '{{ title }}|{{ content }}',
+                              '<{{ slug }}>')
+        self.assertEqual(self.read('2018-01', 'index.html'),
+                         'Archive: January 2018|<b>')
+        self.assertEqual(self.read('2018', 'index.html'),
+                         'Archive: 2018|<h3>February 2018</h3><br><c>'
+                         '<h3>January 2018</h3><br><b>')
+        overview = self.read('archive.html')
+        self.assertIn('<a href="/blog/2018/">2018</a> (2)', overview)
+        self.assertIn('<a href="/blog/2017-12/">Dec</a> (1)', overview)
+
+    def test_selected_months(self):
+        makesite.make_archive(self.posts, 'blog', '{{ content }}',
+                              '{{ title }}.')
+        makesite._sink.previous = dict(makesite._sink.manifest)
+        for post in self.posts:
+            post['title'] += '2'
+        try:
+            makesite.make_archive(self.posts, 'blog', '{{ content }}',
+                                  '{{ title }}.', months={'2018-01'})
+        finally:
+            makesite._sink.previous = {}
+        self.assertEqual(self.read('2018-01', 'index.html'), 'B2.')
+        self.assertIn('C2.', self.read('2018', 'index.html'))
+        self.assertEqual(self.read('2018-02', 'index.html'), 'C.')
+        self.assertEqual(self.read('2017', 'index.html'),
+                         '<h3>December 2017</h3><br>A.')
+
+    def test_unknown_previous_output(self):
+        makesite.make_archive(self.posts, 'blog', '{{ content }}', '.',
+                              months={'2018-01'})
+        self.assertTrue(os.path.isfile('_site/blog/2018-02/index.html'))
+        self.assertTrue(os.path.isfile('_site/blog/2017/index.html'))
+
+    def test_changed_months(self):
+        old = makesite.archive_digests(makesite.archive_index(self.posts))
+        self.posts[1] = dict(self.posts[1], title='New B')
+        new = makesite.archive_digests(makesite.archive_index(self.posts[:2]))
+        self.assertEqual(makesite.changed_months(old, new),
+                         {'2018-01', '2017-12'})
+        salted = makesite.archive_digests(makesite.archive_index(self.posts),
+                                          'layout')
+        self.assertEqual(makesite.changed_months(old, salted),
+                         set(old))
+
+
+class IncrementalArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.root_path = path.temppath('incremental_root')
+        for d in ('content', 'layout', 'static'):
+            shutil.copytree(d, os.path.join(self.root_path, d))
+        self.news = os.path.join(self.root_path, 'content', 'news')
+
+    def tearDown(self):
+        shutil.rmtree(self.root_path)
+
+    def build(self):
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            makesite.make_site(self.root_path)
+        return out.getvalue()
+
+    def test_rebuild_changed_month(self):
+        self.build()
+        with open(os.path.join(self.news, '2030-01-05-new.html'), 'w') as f:
+            f.write('<!-- title: New -->\n<p>New</p>')
+        with open(os.path.join(self.root_path, '_site', 'stale.txt'),
+                  'w') as f:
+            f.write('stale')
+        output = self.build()
+        rendered = re.findall(r'=> \S*/_site/news/(\d[\d-]*)/index.html',
+                              output)
+        self.assertEqual(rendered, ['2030-01', '2030'])
+        self.assertFalse(os.path.exists(os.path.join(self.root_path,
+                                                     '_site', 'stale.txt')))
+        manifest = makesite.read_manifest(os.path.join(self.root_path,
+                                                       '_site'))
+        self.assertIn('news/2018-01/index.html', manifest)
+
+    def test_no_digests_in_memory_build(self):
+        sink = makesite.MemorySink()
+        with contextlib.redirect_stdout(io.StringIO()):
+            makesite.make_site(self.root_path, sink)
+        manifest = json.loads(sink.files[makesite.manifest_name])
+        self.assertEqual(set(sink.files),
+                         set(manifest) | {makesite.manifest_name})
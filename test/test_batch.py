@@ -0,0 +1,73 @@
+import unittest
+import contextlib
+import importlib.util
+import io
+import os
+import shutil
+
+import makesite
+from test import path
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.batch_path = path.temppath('batch')
+        for name in ('one', 'two'):
+            for d in ('content', 'layout', 'static'):
+                shutil.copytree(d, os.path.join(self.batch_path, name, d))
+        with open(os.path.join(self.batch_path, 'sites.txt'), 'w') as f:
+            f.write('# sites\none\n\ntwo\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.batch_path)
+
+    def run_batch(self, *argv):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), \
+                contextlib.redirect_stderr(io.StringIO()):
+            makesite.batch(list(argv))
+        return out.getvalue()
+
+    def test_site_list(self):
+        output = self.run_batch('-f', os.path.join(self.batch_path,
+                                                   'sites.txt'))
+        self.assertIn('Built 2 of 2 sites', output)
+        for name in ('one', 'two'):
+            self.assertTrue(os.path.isfile(os.path.join(
+                self.batch_path, name, '_site', 'news', 'rss.xml')))
+        self.assertEqual(os.getcwd(), self.cwd)
+
+    def test_missing_site(self):
+        with self.assertRaises(SystemExit):
+            self.run_batch(os.path.join(self.batch_path, 'one'),
+                           os.path.join(self.batch_path, 'missing'))
+        self.assertTrue(os.path.isfile(os.path.join(
+            self.batch_path, 'one', '_site', 'index.html')))
+
+    @unittest.skipUnless(importlib.util.find_spec('commonmark'),
+                         'commonmark is not installed')
+    def test_shared_markdown_cache(self):
+        one = os.path.join(self.batch_path, 'one')
+        two = os.path.join(self.batch_path, 'two')
+        with open(os.path.join(one, 'content', '_draft.md'), 'w') as f:
+            f.write('# Draft')
+        makesite._markdown.clear()
+        self.addCleanup(makesite._markdown.clear)
+        keys = makesite.prerender_markdown([one, two], Pool())
+        # Both sites have the same two news posts; drafts are not built.
+        self.assertEqual(len(keys[one]), 2)
+        self.assertEqual(keys[one], keys[two])
+        self.assertEqual(len(makesite._markdown), 2)
+
+    def test_caches_cleared(self):
+        one = os.path.join(self.batch_path, 'one')
+        self.run_batch(one)
+        self.assertEqual(makesite._markdown, {})
+        self.assertFalse([key for key in makesite._contents
+                          if key.startswith(os.path.abspath(one))])
+
+
+class Pool:
+    def map(self, fn, *iterables, chunksize=1):
+        return map(fn, *iterables)
@@ -0,0 +1,49 @@
+import unittest
+import os
+import shutil
+
+import makesite
+from test import path
+
+
+class CheckLinksTest(unittest.TestCase):
+    def setUp(self):
+        self.site_path = path.temppath('links_site')
+        os.makedirs(os.path.join(self.site_path, 'blog', '2018-01', 'foo'))
+        self.write('index.html',
+                   '<a href="/blog/2018-01/foo/">ok</a>'
+                   '<a href="/blog/2018-01/bar/">missing</a>'
+                   '<a href="https://example.com/">external</a>'
+                   '<a href="http://localhost:8000/blog/tag_x.html">site</a>'
+                   '<!-- <a href="/commented/">ignored</a> -->'
+                   '<img src="/css/none.png">')
+        self.write('blog/2018-01/foo/index.html',
+                   '<h2 id="top">Foo</h2>'
+                   '<a href="#top">ok</a><a href="#nope">bad anchor</a>'
+                   '<a href="../../tag_x.html">ok</a>'
+                   '<a href="/blog/2018-01/foo">ok</a>'
+                   '<a href="/blog/2018-01/foo/#top">ok</a>')
+        self.write('blog/tag_x.html', '<a href="mailto:a@b.c">mail</a>')
+
+    def tearDown(self):
+        shutil.rmtree(self.site_path)
+
+    def write(self, name, text):
+        with open(os.path.join(self.site_path, name), 'w') as f:
+            f.write(text)
+
+    def test_broken_links(self):
+        broken = makesite.check_links(self.site_path,
+                                      site_url='http://localhost:8000')
+        self.assertEqual(broken, [
+            ('blog/2018-01/foo/index.html', '#nope'),
+            ('index.html', '/blog/2018-01/bar/'),
+            ('index.html', '/css/none.png'),
+        ])
+
+    def test_base_path(self):
+        self.write('index.html', '<a href="/base/blog/tag_x.html">ok</a>'
+                                 '<a href="/blog/tag_x.html">bad</a>')
+        broken = makesite.check_links(self.site_path, base_path='/base')
+        self.assertIn(('index.html', '/blog/tag_x.html'), broken)
+        self.assertNotIn(('index.html', '/base/blog/tag_x.html'), broken)
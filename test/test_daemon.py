@@ -0,0 +1,144 @@
+import unittest
+import contextlib
+import io
+import json
+import os
+import shutil
+import socket
+import threading
+
+import makesite
+from test import path
+
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.root_path = path.temppath('daemon_root')
+        for d in ('content', 'layout', 'static'):
+            shutil.copytree(d, os.path.join(self.root_path, d))
+        self.server = None
+
+    def tearDown(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.root_path)
+
+    def start_daemon(self):
+        sock = os.path.join(self.root_path, makesite.socket_name)
+        self.server = makesite.make_daemon(sock)
+        threading.Thread(target=self.server.serve_forever, args=(0.05,),
+                         daemon=True).start()
+
+    def run_client(self, stderr=None):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), \
+                contextlib.redirect_stderr(stderr or io.StringIO()):
+            makesite.client([self.root_path])
+        return out.getvalue()
+
+    def request(self, line):
+        with socket.socket(socket.AF_UNIX) as s:
+            s.connect(os.path.join(self.root_path, makesite.socket_name))
+            s.sendall(line)
+            with s.makefile('rb') as f:
+                return json.loads(f.readline())
+
+    def test_build_via_daemon(self):
+        self.start_daemon()
+        output = self.run_client()
+        self.assertIn('Built by daemon', output)
+        self.assertIn('/_site/news/rss.xml', output)
+        self.assertTrue(os.path.isfile(os.path.join(
+            self.root_path, '_site', 'news', 'index.html')))
+
+    def test_errors_on_stderr(self):
+        with open(os.path.join(self.root_path, 'params.json'), 'w') as f:
+            f.write('{"blogs": {"1": {"name": "Gone", "dir": "gone"}}}')
+        self.start_daemon()
+        stderr = io.StringIO()
+        output = self.run_client(stderr)
+        self.assertIn('Built by daemon', output)
+        self.assertNotIn('WARNING', output)
+        self.assertIn('WARNING', stderr.getvalue())
+
+    def test_bad_requests(self):
+        self.start_daemon()
+        for line in (b'not json\n', b'{}\n', b'[1]\n', b'{"root": 1}\n'):
+            reply = self.request(line)
+            self.assertEqual(reply['status'], 1)
+            self.assertIn('Bad request', reply['stderr'])
+        reply = self.request(b'{"root": "serve"}\n')
+        self.assertEqual(reply['status'], 1)
+        self.assertIn("'serve' does not exist", reply['stderr'])
+
+    def test_deleted_content_forgotten(self):
+        about = os.path.join(self.root_path, 'content', 'about.html')
+        with contextlib.redirect_stdout(io.StringIO()):
+            makesite.make_site(self.root_path)
+            self.assertIn(about, makesite._contents)
+            os.remove(about)
+            makesite.make_site(self.root_path)
+        self.assertNotIn(about, makesite._contents)
+        self.assertIn(os.path.join(self.root_path, 'content', 'contact.html'),
+                      makesite._contents)
+
+    def test_wedged_daemon(self):
+        sock = os.path.join(self.root_path, makesite.socket_name)
+        listener = socket.socket(socket.AF_UNIX)
+        listener.bind(sock)
+        listener.listen(0)      # never accepts
+        pending = []
+        timeout = makesite.connect_timeout
+        makesite.connect_timeout = 0.2
+        try:
+            # Fill the backlog so that further connects stall.
+            for _ in range(4):
+                s = socket.socket(socket.AF_UNIX)
+                s.setblocking(False)
+                try:
+                    s.connect(sock)
+                except BlockingIOError:
+                    s.close()
+                    break
+                pending.append(s)
+            output = self.run_client()
+        finally:
+            makesite.connect_timeout = timeout
+            for s in pending:
+                s.close()
+            listener.close()
+        self.assertNotIn('Built by daemon', output)
+        self.assertTrue(os.path.isfile(os.path.join(
+            self.root_path, '_site', 'news', 'index.html')))
+
+    def test_cold_fallback(self):
+        output = self.run_client()
+        self.assertNotIn('Built by daemon', output)
+        self.assertTrue(os.path.isfile(os.path.join(
+            self.root_path, '_site', 'news', 'index.html')))
+
+
+class LoadContentTest(unittest.TestCase):
+    def setUp(self):
+        self.filename = path.temppath('load-content.html')
+        with open(self.filename, 'w') as f:
+            f.write('<!-- title: Foo -->\nFoo')
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_reuse_and_reload(self):
+        first = makesite.load_content(self.filename)
+        first['related'] = 'x'
+        second = makesite.load_content(self.filename)
+        self.assertNotIn('related', second)
+        self.assertIs(first['content'], second['content'])
+
+        with open(self.filename, 'w') as f:
+            f.write('<!-- title: Bar -->\nBarBar')
+        third = makesite.load_content(self.filename)
+        self.assertEqual(third['title'], 'Bar')
+        self.assertEqual(str(third['content']), 'BarBar')
@@ -1,5 +1,7 @@
 import unittest
+import os
 import makesite
+from test import path
 
 
 class HeaderTest(unittest.TestCase):
@@ -41,3 +43,57 @@ class HeaderTest(unittest.TestCase):
     def test_empty_string(self):
         headers = list(makesite.read_headers(''))
         self.assertEqual(headers, [])
+
+
+class ScanHeadersTest(unittest.TestCase):
+    """Tests for scan_headers() and lazy read_content()."""
+
+    def setUp(self):
+        self.filename = path.temppath('scan-headers.html')
+        self.text = ('<!-- a: 1 -->\n<!--\nb: 2 -->\n\n<!-- c: 3 -->\n'
+                     'Foo\n<!-- d: 4 -->')
+        with open(self.filename, 'w') as f:
+            f.write(self.text)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_chunked_scan(self):
+        for chunksize in (1, 3, 7, 4096):
+            headers, end = makesite.scan_headers(self.filename, chunksize)
+            self.assertEqual(headers, {'a': '1', 'b': '2', 'c': '3'})
+            self.assertEqual(self.text[end:], 'Foo\n<!-- d: 4 -->')
+
+    def test_long_header_block(self):
+        text = ''.join(f'<!-- k{i}: {i} -->\n' for i in range(500)) + 'Foo'
+        with open(self.filename, 'w') as f:
+            f.write(text)
+        for chunksize in (5, 64):
+            headers, end = makesite.scan_headers(self.filename, chunksize)
+            self.assertEqual(len(headers), 500)
+            self.assertEqual(headers['k499'], '499')
+            self.assertEqual(text[end:], 'Foo')
+
+    def test_single_read(self):
+        opened = []
+        makesite.open = lambda filename, *args: opened.append(filename) or \
+            open(filename, *args)
+        try:
+            content = makesite.read_content(self.filename)
+        finally:
+            del makesite.open
+        self.assertEqual(opened, [self.filename])
+        self.assertEqual(content['content'], 'Foo\n<!-- d: 4 -->')
+
+    def test_lazy_body(self):
+        content = makesite.read_content(self.filename, lazy=True)
+        self.assertEqual(content['c'], '3')
+        self.assertIsNone(content['content'].text)
+        self.assertEqual(str(content['content']), 'Foo\n<!-- d: 4 -->')
+
+    def test_created_header(self):
+        with open(self.filename, 'w') as f:
+            f.write('<!-- created: 2018-01-05 -->\nFoo')
+        content = makesite.read_content(self.filename)
+        self.assertEqual(content['date'], '2018-01-05')
+        self.assertEqual(content['content'], 'Foo')
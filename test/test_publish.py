@@ -0,0 +1,116 @@
+import unittest
+import os
+import shutil
+import json
+
+import makesite
+from test import path
+
+
+class PublishTest(unittest.TestCase):
+    def setUp(self):
+        self.site_path = path.temppath('publish_site')
+        self.dest_path = path.temppath('publish_dest')
+        os.makedirs(self.site_path)
+        self.build({'a.html': 'A', 'b.html': 'B'})
+
+    def tearDown(self):
+        shutil.rmtree(self.site_path)
+        if os.path.islink(self.dest_path):
+            os.remove(self.dest_path)
+        for name in self.releases():
+            shutil.rmtree(os.path.join(os.path.dirname(self.dest_path), name))
+
+    def releases(self):
+        prefix = '.' + os.path.basename(self.dest_path) + '.'
+        return [name for name in os.listdir(os.path.dirname(self.dest_path))
+                if name.startswith(prefix)]
+
+    def build(self, files):
+        shutil.rmtree(self.site_path)
+        os.makedirs(self.site_path)
+        manifest = {}
+        for name, text in files.items():
+            with open(os.path.join(self.site_path, name), 'w') as f:
+                f.write(text)
+            manifest[name] = text
+        with open(os.path.join(self.site_path, '.manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+
+    def read(self, name):
+        with open(os.path.join(self.dest_path, name)) as f:
+            return f.read()
+
+    def test_first_publish(self):
+        copied, unchanged, removed = makesite.publish(self.site_path,
+                                                      self.dest_path)
+        self.assertEqual(copied, ['a.html', 'b.html'])
+        self.assertEqual((unchanged, removed), ([], []))
+        self.assertEqual(self.read('a.html'), 'A')
+        self.assertTrue(os.path.islink(self.dest_path))
+
+    def test_delta_publish(self):
+        makesite.publish(self.site_path, self.dest_path)
+        self.build({'b.html': 'B2', 'c.html': 'C'})
+        copied, unchanged, removed = makesite.publish(self.site_path,
+                                                      self.dest_path)
+        self.assertEqual(copied, ['b.html', 'c.html'])
+        self.assertEqual(removed, ['a.html'])
+        self.assertFalse(os.path.exists(os.path.join(self.dest_path,
+                                                     'a.html')))
+        self.assertEqual(self.read('b.html'), 'B2')
+
+    def test_unchanged_files_not_copied(self):
+        makesite.publish(self.site_path, self.dest_path)
+        copied, unchanged, _ = makesite.publish(self.site_path,
+                                                self.dest_path)
+        self.assertEqual(copied, [])
+        self.assertEqual(unchanged, ['a.html', 'b.html'])
+
+    def test_release_swap(self):
+        makesite.publish(self.site_path, self.dest_path)
+        first = os.readlink(self.dest_path)
+        makesite.publish(self.site_path, self.dest_path)
+        self.assertNotEqual(os.readlink(self.dest_path), first)
+        self.assertEqual(self.releases(), [os.readlink(self.dest_path)])
+
+    def test_interrupted_release_removed(self):
+        makesite.publish(self.site_path, self.dest_path)
+        stale = self.dest_path.replace('publish_dest', '.publish_dest.1')
+        os.makedirs(stale)
+        makesite.publish(self.site_path, self.dest_path)
+        self.assertFalse(os.path.exists(stale))
+        self.assertEqual(self.read('b.html'), 'B')
+
+    def test_plain_directory(self):
+        os.makedirs(self.dest_path)
+        with open(os.path.join(self.dest_path, 'old.html'), 'w') as f:
+            f.write('old')
+        makesite.publish(self.site_path, self.dest_path)
+        self.assertTrue(os.path.islink(self.dest_path))
+        self.assertEqual(sorted(os.listdir(self.dest_path)),
+                         ['.manifest.json', 'a.html', 'b.html'])
+        self.assertEqual(len(self.releases()), 1)
+
+    def test_trailing_slash(self):
+        makesite.publish(self.site_path, self.dest_path)
+        makesite.publish(self.site_path, self.dest_path + '/')
+        self.assertTrue(os.path.islink(self.dest_path))
+        self.assertEqual(self.read('a.html'), 'A')
+        self.assertEqual(self.releases(), [os.readlink(self.dest_path)])
+
+    def test_foreign_symlink(self):
+        foreign = path.temppath('publish_foreign')
+        os.makedirs(foreign)
+        self.addCleanup(shutil.rmtree, foreign)
+        with open(os.path.join(foreign, 'keep.html'), 'w') as f:
+            f.write('keep')
+        os.symlink(foreign, self.dest_path)
+        makesite.publish(self.site_path, self.dest_path)
+        self.assertEqual(self.read('a.html'), 'A')
+        self.assertEqual(os.listdir(foreign), ['keep.html'])
+
+    def test_missing_manifest(self):
+        os.remove(os.path.join(self.site_path, '.manifest.json'))
+        with self.assertRaises(FileNotFoundError):
+            makesite.publish(self.site_path, self.dest_path)
@@ -0,0 +1,59 @@
+import unittest
+import os
+import shutil
+
+import makesite
+from test import path
+
+
+class RelatedTest(unittest.TestCase):
+    def setUp(self):
+        self.posts = [
+            {'date': '2018-01-04', 'tags': 'a b c'},
+            {'date': '2018-01-03', 'tags': 'a b'},
+            {'date': '2018-01-02', 'tags': 'c'},
+            {'date': '2018-01-01', 'tags': 'd'},
+            {'date': '2017-12-31'},
+        ]
+
+    def test_ranking(self):
+        related = makesite.related_posts(self.posts)
+        self.assertEqual(related, [[1, 2], [0], [0], [], []])
+
+    def test_top_k(self):
+        related = makesite.related_posts(self.posts, k=1)
+        self.assertEqual(related[0], [1])
+
+    def test_window(self):
+        posts = [{'tags': 'common'} for _ in range(10)]
+        related = makesite.related_posts(posts, k=5, window=2)
+        self.assertEqual(related[0], [1, 2])
+        self.assertEqual(related[5], [4, 6])
+        self.assertEqual(related[9], [7, 8])
+
+
+class RelatedPagesTest(unittest.TestCase):
+    def setUp(self):
+        self.blog_path = path.temppath('related_blog')
+        self.site_path = path.temppath('related_site')
+        os.makedirs(self.blog_path)
+        posts = {'2018-01-01-foo.html': 'x y', '2018-01-02-bar.html': 'y',
+                 '2018-01-03-baz.html': 'z'}
+        for name, tags in posts.items():
+            with open(os.path.join(self.blog_path, name), 'w') as f:
+                f.write('<!-- title: T -->\n'
+                        '<!-- tags: {} -->\nText'.format(tags))
+
+    def tearDown(self):
+        shutil.rmtree(self.blog_path)
+        shutil.rmtree(self.site_path)
+
+    def test_related_placeholder(self):
+        src = os.path.join(self.blog_path, '*.html')
+        dst = os.path.join(self.site_path, '{{ slug }}.txt')
+        makesite.make_pages(src, dst, '{{ related }}', '<{{ slug }}>',
+                            alltags={})
+        with open(os.path.join(self.site_path, 'foo.txt')) as f:
+            self.assertIn('<ul>\n<bar></ul>', f.read())
+        with open(os.path.join(self.site_path, 'baz.txt')) as f:
+            self.assertEqual(f.read(), '')
@@ -1,5 +1,11 @@
 import unittest
+import collections
+import os
+import shutil
+
 import makesite
+from test import path
+
 
 class RenderTest(unittest.TestCase):
     """Tests for render() function."""
@@ -23,3 +29,58 @@ class RenderTest(unittest.TestCase):
         tpl = 'foo {{\nkey1\n}} baz {{\nkey2\n}}'
         out = makesite.render(tpl, key1='bar', key2='qux')
         self.assertEqual(out, 'foo bar baz qux')
+
+    def test_missing_key(self):
+        tpl = 'foo {{ key1 }} baz {{key2}}'
+        out = makesite.render(tpl, key1='bar')
+        self.assertEqual(out, 'foo bar baz {{key2}}')
+
+    def test_render_to_stream(self):
+        pieces = []
+        value = makesite.Stream(lambda out: [out.write(s) for s in 'abc'])
+        makesite.render_to(Recorder(pieces), '<{{ key1 }}>', {'key1': value})
+        self.assertEqual(pieces, ['<', 'a', 'b', 'c', '>'])
+        self.assertEqual(makesite.render('{{ key1 }}', key1=value), 'abc')
+
+    def test_context_lookup(self):
+        site = {'key1': 'site', 'key2': 'qux'}
+        page = {'key1': 'page'}
+        ctx = collections.ChainMap(page, site)
+        out = makesite.render('{{ key1 }} {{ key2 }} {{ key3 }}', ctx,
+                              key3='baz')
+        self.assertEqual(out, 'page qux baz')
+        self.assertEqual(site, {'key1': 'site', 'key2': 'qux'})
+
+    def test_params_named_like_arguments(self):
+        out = makesite.render('{{ template }} {{ context }}',
+                              template='foo', context='bar')
+        self.assertEqual(out, 'foo bar')
+
+
+class RenderContentTest(unittest.TestCase):
+    """Tests for rendering page content as a template."""
+
+    def setUp(self):
+        self.site_path = path.temppath('render_site')
+        self.src = path.temppath('render-content.html')
+        with open(self.src, 'w') as f:
+            f.write('<!-- render: yes -->\n<p>{{ author }}</p>')
+
+    def tearDown(self):
+        os.remove(self.src)
+        shutil.rmtree(self.site_path)
+
+    def test_content_not_cached(self):
+        makesite.make_pages(self.src, self.site_path + '/index.html',
+                            '{{ content }}', author='Admin')
+        with open(os.path.join(self.site_path, 'index.html')) as f:
+            self.assertEqual(f.read(), '<p>Admin</p>')
+        cached = makesite.compile_template.cache_info().currsize
+        makesite.compile_template('<p>{{ author }}</p>')
+        self.assertEqual(makesite.compile_template.cache_info().currsize,
+                         cached + 1)
+
+
+class Recorder:
+    def __init__(self, pieces):
+        self.write = pieces.append
@@ -0,0 +1,47 @@
+import unittest
+import os
+import shutil
+
+import makesite
+from test import path
+
+
+class ScanContentTest(unittest.TestCase):
+    def setUp(self):
+        self.content = path.temppath('scan')
+        for name in ['_index.html', 'about.html', 'notes.md', '_draft.html',
+                     '.hidden.html', 'misc/a.html', '.git/b.html',
+                     'blog/2018-01/2018-01-01-foo.html',
+                     'blog/2018-01/2018-01-02-bar.md']:
+            filename = os.path.join(self.content, name)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, 'w') as f:
+                f.write('foo')
+
+    def tearDown(self):
+        shutil.rmtree(self.content)
+
+    def test_kinds(self):
+        index = makesite.scan_content(self.content, ['/blog/'])
+        kinds = {os.path.relpath(e.path, self.content): e.kind for e in index}
+        self.assertEqual(kinds, {
+            '_index.html': 'index',
+            'about.html': 'page',
+            'notes.md': 'page',
+            '_draft.html': 'other',
+            os.path.join('misc', 'a.html'): 'other',
+            os.path.join('blog', '2018-01', '2018-01-01-foo.html'): 'post',
+            os.path.join('blog', '2018-01', '2018-01-02-bar.md'): 'post',
+        })
+
+    def test_entries(self):
+        index = makesite.scan_content(self.content, ['blog'])
+        self.assertEqual([e.path for e in index],
+                         sorted(e.path for e in index))
+        posts = [e for e in index if e.blog == 'blog']
+        self.assertEqual([e.ext for e in posts], ['.html', '.md'])
+        self.assertTrue(all(e.stat.st_size == 3 for e in index))
+
+    def test_no_blogs(self):
+        index = makesite.scan_content(self.content)
+        self.assertFalse(any(e.kind == 'post' for e in index))
@@ -0,0 +1,167 @@
+import unittest
+import threading
+import urllib.request
+import urllib.error
+import gzip
+import os
+import shutil
+
+import makesite
+from test import path
+
+
+class ServeTest(unittest.TestCase):
+    def setUp(self):
+        self.site_path = path.temppath('serve_site')
+        os.makedirs(os.path.join(self.site_path, 'foo'))
+        with open(os.path.join(self.site_path, 'foo', 'index.html'), 'w') as f:
+            f.write('<p>Foo</p>')
+        with open(os.path.join(self.site_path, 'bar.css'), 'w') as f:
+            f.write('body {}')
+        with open(os.path.join(self.site_path, 'bar.css.gz'), 'wb') as f:
+            f.write(gzip.compress(b'body { }'))
+
+        self.httpd = makesite.make_server(self.site_path, 'localhost', 0)
+        self.url = 'http://localhost:{}'.format(self.httpd.server_address[1])
+        threading.Thread(target=self.httpd.serve_forever,
+                         args=(0.05,), daemon=True).start()
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        shutil.rmtree(self.site_path)
+
+    def get(self, url, **headers):
+        req = urllib.request.Request(self.url + url, headers=headers)
+        try:
+            with urllib.request.urlopen(req) as resp:
+                return resp.status, resp.headers, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, b''
+
+    def test_index_etag(self):
+        status, headers, body = self.get('/foo/')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'<p>Foo</p>')
+        self.assertTrue(headers['ETag'].startswith('"'))
+
+    def test_not_modified(self):
+        _, headers, _ = self.get('/foo/')
+        status, _, body = self.get('/foo/',
+                                   **{'If-None-Match': headers['ETag']})
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+
+    def test_modified(self):
+        status, _, _ = self.get('/foo/', **{'If-None-Match': '"stale"'})
+        self.assertEqual(status, 200)
+
+    def test_precompressed(self):
+        status, headers, body = self.get('/bar.css',
+                                         **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), b'body { }')
+
+    def test_compressed_on_the_fly(self):
+        _, plain, _ = self.get('/foo/')
+        status, headers, body = self.get('/foo/',
+                                         **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), b'<p>Foo</p>')
+        self.assertNotEqual(headers['ETag'], plain['ETag'])
+
+    def test_refused_encoding(self):
+        status, headers, body = self.get('/foo/', **{
+            'Accept-Encoding': 'gzip;q=0, identity'})
+        self.assertIsNone(headers['Content-Encoding'])
+        self.assertEqual(body, b'<p>Foo</p>')
+
+    def test_missing(self):
+        status, _, _ = self.get('/missing.html')
+        self.assertEqual(status, 404)
+
+
+class LargeFileServeTest(ServeTest):
+    """Files over the cache limit are streamed with stat-based ETags."""
+
+    def setUp(self):
+        super().setUp()
+        self.httpd.RequestHandlerClass.cache = makesite.FileCache(maxbytes=4)
+
+    def test_compressed_on_the_fly(self):
+        status, headers, body = self.get('/foo/',
+                                         **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(status, 200)
+        self.assertIsNone(headers['Content-Encoding'])
+        self.assertEqual(body, b'<p>Foo</p>')
+        self.assertEqual(headers['Content-Length'], '10')
+
+
+class FileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.filename = path.temppath('cache.txt')
+        with open(self.filename, 'w') as f:
+            f.write('12345')
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_eviction(self):
+        cache = makesite.FileCache(maxbytes=5)
+        body, etag = cache.get(self.filename)
+        self.assertEqual(body, b'12345')
+        self.assertEqual(cache.size, 5)
+        cache.get(self.filename, compress=True)
+        self.assertLessEqual(cache.size, 5)
+
+
+    def test_large_file(self):
+        cache = makesite.FileCache(maxbytes=4)
+        body, etag = cache.get(self.filename)
+        with body:
+            self.assertEqual(body.read(), b'12345')
+        st = os.stat(self.filename)
+        self.assertEqual(etag, '"{:x}-{:x}"'.format(st.st_mtime_ns, 5))
+        self.assertEqual(cache.size, 0)
+
+    def test_memory(self):
+        cache = makesite.FileCache()
+        files = {'foo.txt': b'foo'}
+        body, etag = cache.get('foo.txt', True, files)
+        self.assertEqual(gzip.decompress(body), b'foo')
+        self.assertIs(cache.get('foo.txt', True, files)[0], body)
+        files['foo.txt'] = b'bar'
+        self.assertNotEqual(cache.get('foo.txt', True, files)[1], etag)
+
+
+class AcceptEncodingTest(unittest.TestCase):
+    def test_tokens(self):
+        self.assertEqual(makesite.accepted_encodings('gzip, br'),
+                         {'gzip', 'br'})
+        self.assertEqual(makesite.accepted_encodings('br;q=0, gzip;q=0.5'),
+                         {'gzip'})
+        self.assertEqual(makesite.accepted_encodings('x-gzip-ish, *;q=0'),
+                         set())
+        self.assertEqual(makesite.accepted_encodings('*, br;q=0'), {'gzip'})
+        self.assertEqual(makesite.accepted_encodings(''), set())
+
+
+class MemoryServeTest(ServeTest):
+    def setUp(self):
+        files = {'foo/index.html': b'<p>Foo</p>',
+                 'bar.css': b'body {}',
+                 'bar.css.gz': gzip.compress(b'body { }')}
+        self.httpd = makesite.make_server(None, 'localhost', 0, files=files)
+        self.url = 'http://localhost:{}'.format(self.httpd.server_address[1])
+        threading.Thread(target=self.httpd.serve_forever,
+                         args=(0.05,), daemon=True).start()
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def test_redirect(self):
+        status, _, body = self.get('/foo')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'<p>Foo</p>')
@@ -0,0 +1,97 @@
+import unittest
+import io
+import os
+import shutil
+import tarfile
+import zipfile
+
+import makesite
+from test import path
+
+
+class SinkTest(unittest.TestCase):
+    def setUp(self):
+        self.site_path = path.temppath('sink_site')
+        self.sink = makesite._sink
+
+    def tearDown(self):
+        makesite._sink = self.sink
+        if os.path.isdir(self.site_path):
+            shutil.rmtree(self.site_path)
+
+    def make_list(self):
+        posts = [{'content': 'Foo'}, {'content': 'Bar'}]
+        dst = os.path.join(self.site_path, 'blog', 'list.txt')
+        makesite.make_list(posts, dst, '<div>{{ content }}</div>',
+                           '<p>{{ content }}</p>')
+
+    def test_dir_sink(self):
+        self.make_list()
+        with open(os.path.join(self.site_path, 'blog', 'list.txt')) as f:
+            self.assertEqual(f.read(), '<div><p>Foo</p><p>Bar</p></div>')
+
+    def test_copy_static(self):
+        static = path.temppath('sink_static')
+        os.makedirs(os.path.join(static, 'css'))
+        src = os.path.join(static, 'css', 'style.css')
+        with open(src, 'w') as f:
+            f.write('body {}')
+        os.chmod(src, 0o664)
+        os.utime(src, (1000000000, 1000000000))
+        try:
+            makesite._sink = makesite.DirSink(self.site_path)
+            makesite.copy_static(static, self.site_path)
+        finally:
+            shutil.rmtree(static)
+        st = os.stat(os.path.join(self.site_path, 'css', 'style.css'))
+        self.assertEqual(st.st_mode & 0o777, 0o664)
+        self.assertEqual(st.st_mtime, 1000000000)
+        self.assertEqual(makesite._sink.manifest,
+                         {'css/style.css':
+                          '40294f6c20ee96ece54f2f24804c4b43091f8a86'})
+
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            makesite.Sink()
+
+    def test_memory_sink(self):
+        makesite._sink = makesite.MemorySink(self.site_path)
+        self.make_list()
+        self.assertEqual(makesite._sink.files,
+                         {'blog/list.txt': b'<div><p>Foo</p><p>Bar</p></div>'})
+        self.assertFalse(os.path.exists(self.site_path))
+
+    def test_tar_sink(self):
+        buf = io.BytesIO()
+        makesite._sink = makesite.ArchiveSink(buf, 'tar', 'gz',
+                                              root=self.site_path)
+        self.make_list()
+        makesite._sink.close()
+        buf.seek(0)
+        with tarfile.open(fileobj=buf) as tar:
+            self.assertEqual(tar.getnames(), ['blog/list.txt'])
+            self.assertEqual(tar.extractfile('blog/list.txt').read(),
+                             b'<div><p>Foo</p><p>Bar</p></div>')
+
+    def test_zip_sink(self):
+        buf = io.BytesIO()
+        makesite._sink = makesite.ArchiveSink(buf, 'zip', root=self.site_path)
+        self.make_list()
+        makesite._sink.close()
+        with zipfile.ZipFile(buf) as z:
+            self.assertEqual(z.read('blog/list.txt'),
+                             b'<div><p>Foo</p><p>Bar</p></div>')
+
+    def test_fopen_streams_through_sink(self):
+        buf = io.BytesIO()
+        makesite._sink = makesite.ArchiveSink(buf, root=self.site_path)
+        filename = os.path.join(self.site_path, 'big.txt')
+        with makesite.fopen(filename) as out:
+            for i in range(20000):
+                out.write('line {}\n'.format(i))
+        makesite._sink.close()
+        buf.seek(0)
+        with tarfile.open(fileobj=buf) as tar:
+            data = tar.extractfile('big.txt').read()
+        self.assertEqual(data.count(b'\n'), 20000)
+        self.assertTrue(data.endswith(b'line 19999\n'))